@@ -5,12 +5,14 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import os
-import time
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from fpdf import FPDF
 import xlsxwriter
+from streamlit_autorefresh import st_autorefresh
 
 # ---------------------------
 # Page Config & Styling
@@ -88,37 +90,79 @@ tax_pct = st.sidebar.slider("Tax %", 0.0, 0.5, 0.20)
 runs = st.sidebar.slider("Simulation Runs", 50, 5000, 300)
 auto_refresh = st.sidebar.checkbox("Enable Auto Refresh", value=False)
 refresh_seconds = st.sidebar.number_input("Refresh Interval (sec)", min_value=5, max_value=300, value=10)
-save_folder = st.sidebar.text_input("Auto-save Folder", value="simulation_outputs")
+seed = st.sidebar.number_input("Random Seed (0 = random)", min_value=0, max_value=2**32 - 1, value=0, step=1)
+save_folder = st.sidebar.text_input("Export Folder", value="simulation_outputs")
 
-os.makedirs(save_folder, exist_ok=True)
+# Shared PCG64 generator, kept in session state so the stream advances across
+# reruns and refresh ticks; it is rebuilt only when the seed changes
+if st.session_state.get("rng_seed") != seed or "rng" not in st.session_state:
+    st.session_state.rng = np.random.default_rng(seed if seed else None)
+    st.session_state.rng_seed = seed
+RNG = st.session_state.rng
 
 # ---------------------------
 # Simulation Logic
 # ---------------------------
 def simulate_df(base_sales, gr, cost_pct, tax_pct, n_runs):
-    rows = []
-    for _ in range(n_runs):
-        rev = base_sales * (1 + np.random.uniform(-gr, gr))
-        cost = rev * np.random.uniform(cost_pct - 0.05, cost_pct + 0.05)
-        profit = (rev - cost) * (1 - tax_pct)
-        rows.append((rev, cost, profit))
-    df = pd.DataFrame(rows, columns=["Revenue", "Cost", "Profit"])
+    # Fill one preallocated buffer; Fortran order keeps each column contiguous
+    # so the DataFrame can wrap it without copying
+    out = np.empty((n_runs, 3), order='F')
+    # Draw all runs in one batch and compute whole-array columns in place
+    rev, cost, profit = out[:, 0], out[:, 1], out[:, 2]
+    u1 = RNG.uniform(-gr, gr, n_runs)
+    u2 = RNG.uniform(cost_pct - 0.05, cost_pct + 0.05, n_runs)
+    np.add(u1, 1, out=rev)
+    rev *= base_sales
+    np.multiply(rev, u2, out=cost)
+    np.subtract(rev, cost, out=profit)
+    profit *= 1 - tax_pct
+    df = pd.DataFrame(out, columns=["Revenue", "Cost", "Profit"], copy=False)
     return df
 
+@st.cache_data(show_spinner=False, ttl=3600)
+def sensitivity_curve(base_sales, cost_pct, tax_pct, seed, n_runs=200):
+    # The cache is shared across sessions, so draw from a local generator built
+    # from the seed argument rather than the session's RNG
+    rng = np.random.default_rng(seed if seed else None)
+    # All growth rates in one (len(grs), n_runs) batch instead of one simulation each
+    grs = np.linspace(0.05, 0.25, 5)
+    u1 = rng.uniform(-1, 1, (len(grs), n_runs)) * grs[:, None]
+    u2 = rng.uniform(cost_pct - 0.05, cost_pct + 0.05, (len(grs), n_runs))
+    rev = base_sales * (1 + u1)
+    cost = rev * u2
+    profit = (rev - cost) * (1 - tax_pct)
+    avg_profits = profit.mean(axis=1)
+    return grs, avg_profits
+
 # ---------------------------
 # Excel Export with Chart
 # ---------------------------
-def save_excel_with_chart(df, filepath):
-    with pd.ExcelWriter(filepath, engine='xlsxwriter') as writer:
-        df.to_excel(writer, sheet_name='Simulations', index=False)
-        workbook = writer.book
-        worksheet = writer.sheets['Simulations']
+def save_excel_with_chart(df, filepath, max_chart_points=200):
+    # constant_memory flushes each row as it is written, so rows must go in order
+    with xlsxwriter.Workbook(filepath, {'constant_memory': True}) as workbook:
+        worksheet = workbook.add_worksheet('Simulations')
+        # Same bold, bordered header row that df.to_excel used to write
+        header_fmt = workbook.add_format({'bold': True, 'border': 1})
+        worksheet.write_row(0, 0, df.columns.tolist(), header_fmt)
+        # One bulk conversion to native floats, then one write_row call per run
+        for i, row in enumerate(df.to_numpy().tolist(), start=1):
+            worksheet.write_row(i, 0, row)
+
+        # Chart at most max_chart_points evenly spaced runs, kept on a hidden sheet
+        step = max(1, -(-len(df) // max_chart_points))
+        chart_df = df["Profit"].iloc[::step]
+        chart_sheet = workbook.add_worksheet('ChartData')
+        chart_sheet.write_row(0, 0, ['Run', 'Profit'])
+        for i, (run, profit) in enumerate(zip(chart_df.index.tolist(), chart_df.tolist()), start=1):
+            chart_sheet.write_row(i, 0, [run + 1, profit])
+        chart_sheet.hide()
+
         chart = workbook.add_chart({'type': 'column'})
-        max_row = len(df)
+        n_points = len(chart_df)
         chart.add_series({
             'name': 'Profit',
-            'values':     ['Simulations', 1, 2, max_row, 2],
-            'categories': ['Simulations', 1, 0, max_row, 0],
+            'values':     ['ChartData', 1, 1, n_points, 1],
+            'categories': ['ChartData', 1, 0, n_points, 0],
         })
         chart.set_title({'name': 'Simulated Profits'})
         chart.set_x_axis({'name': 'Run'})
@@ -128,29 +172,54 @@ def save_excel_with_chart(df, filepath):
 # ---------------------------
 # Chart Images for PDF
 # ---------------------------
-def save_chart_images(df, basepath):
-    hist_path = f"{basepath}_hist.png"
-    fig1, ax1 = plt.subplots(figsize=(8,4))
-    ax1.hist(df["Profit"], bins=20, edgecolor='black')
+def profit_bin_edges(base_sales, gr, cost_pct, tax_pct, bins=20):
+    # Bins span the full support of simulated profit, so they stay fixed between refreshes
+    lo = base_sales * (1 - gr) * (1 - (cost_pct + 0.05)) * (1 - tax_pct)
+    hi = base_sales * (1 + gr) * (1 - (cost_pct - 0.05)) * (1 - tax_pct)
+    return np.linspace(lo, hi, bins + 1)
+
+def get_chart_figure(key):
+    # One figure per chart, kept in session state and redrawn in place each tick.
+    # Bound straight to an Agg canvas so pyplot's figure manager is never involved.
+    if key not in st.session_state:
+        fig = Figure(figsize=(8,4))
+        FigureCanvasAgg(fig)
+        fig.subplots()
+        st.session_state[key] = fig
+    return st.session_state[key]
+
+def draw_charts(df):
+    fig1 = get_chart_figure("fig_hist")
+    ax1 = fig1.axes[0]
+    ax1.cla()
+    edges = profit_bin_edges(sales, growth_rate, cost_pct, tax_pct)
+    counts, _ = np.histogram(df["Profit"].to_numpy(), bins=edges)
+    ax1.bar(edges[:-1], counts, width=np.diff(edges), align='edge', edgecolor='black')
     ax1.set_title("Simulated Profit Distribution")
     ax1.set_xlabel("Profit (Rs.)")
     ax1.set_ylabel("Frequency")
     fig1.tight_layout()
-    fig1.savefig(hist_path, dpi=150)
-    plt.close(fig1)
 
-    sens_path = f"{basepath}_sens.png"
-    grs = np.linspace(0.05, 0.25, 5)
-    avg_profits = [simulate_df(sales, g, cost_pct, tax_pct, 200)["Profit"].mean() for g in grs]
-    fig2, ax2 = plt.subplots(figsize=(8,4))
+    grs, avg_profits = sensitivity_curve(sales, cost_pct, tax_pct, seed)
+    fig2 = get_chart_figure("fig_sens")
+    ax2 = fig2.axes[0]
+    ax2.cla()
     ax2.plot(grs*100, avg_profits, marker='o', color='green')
     ax2.set_title("Growth Rate vs Average Profit")
     ax2.set_xlabel("Growth Rate (%)")
     ax2.set_ylabel("Average Profit (Rs.)")
     fig2.tight_layout()
-    fig2.savefig(sens_path, dpi=150)
-    plt.close(fig2)
 
+    return fig1, fig2
+
+def save_chart_images(fig1, fig2, basepath):
+    # Saves the figures already drawn on screen; JPEG keeps the images embedded
+    # in the PDF several times smaller than PNG
+    jpeg_opts = {'quality': 80, 'optimize': True}
+    hist_path = f"{basepath}_hist.jpg"
+    fig1.savefig(hist_path, format='jpeg', dpi=100, pil_kwargs=jpeg_opts)
+    sens_path = f"{basepath}_sens.jpg"
+    fig2.savefig(sens_path, format='jpeg', dpi=100, pil_kwargs=jpeg_opts)
     return hist_path, sens_path
 
 # ---------------------------
@@ -203,48 +272,75 @@ def create_pdf_2page(student, params, metrics, insights, img_hist, img_sens, pdf
     pdf.set_font("Helvetica", "B", 12)
     pdf.cell(0,8,"Charts", ln=True)
     pdf.ln(6)
+    # Both 8x4 charts (90 mm tall at w=180) share the second page
     if os.path.exists(img_hist):
-        pdf.image(img_hist, x=15, y=30, w=180)
-    pdf.add_page()
+        pdf.image(img_hist, x=15, y=40, w=180)
     if os.path.exists(img_sens):
-        pdf.image(img_sens, x=15, y=30, w=180)
+        pdf.image(img_sens, x=15, y=140, w=180)
 
-    pdf_bytes = pdf.output(dest='S').encode('latin1')
-    with open(pdf_path, "wb") as f:
-        f.write(pdf_bytes)
+    pdf.output(pdf_path, 'F')
 
 # ---------------------------
 # Run Simulation
 # ---------------------------
-def run_and_save_once():
-    df_sim = simulate_df(sales, growth_rate, cost_pct, tax_pct, runs)
+INSIGHT_TMPL = (
+    "Higher growth rate improves profits.",
+    "Standard deviation = Rs. {std:,.2f}",
+    "Simulation runs = {runs}",
+)
+
+def get_simulation(tick=0):
+    # Reuse the last frame on cosmetic reruns (e.g. editing the name); new inputs,
+    # a new tick or a Run Once click re-simulate
+    key = (sales, growth_rate, cost_pct, tax_pct, runs, seed, tick, st.session_state.run_count)
+    if st.session_state.get("sim_key") != key:
+        st.session_state.sim_df = simulate_df(sales, growth_rate, cost_pct, tax_pct, runs)
+        st.session_state.sim_key = key
+    return st.session_state.sim_df
+
+def simulate_and_render(tick=0):
+    # Cheap path for every tick: simulate and draw on screen, no disk writes
+    df_sim = get_simulation(tick)
+    fig_hist, fig_sens = draw_charts(df_sim)
+    st.pyplot(fig_hist)
+    st.caption("Profit Distribution")
+    st.pyplot(fig_sens)
+    st.caption("Sensitivity Chart")
+    return df_sim, fig_hist, fig_sens
+
+def export_artifacts(df_sim, fig_hist, fig_sens):
+    # Expensive path, only on explicit user action: Excel, chart images and PDF
+    profit = df_sim["Profit"].to_numpy()
     metrics = {
-        'avg': df_sim["Profit"].mean(),
-        'max': df_sim["Profit"].max(),
-        'min': df_sim["Profit"].min(),
-        'std': df_sim["Profit"].std()
+        'avg': profit.mean(),
+        'max': profit.max(),
+        'min': profit.min(),
+        'std': profit.std(ddof=1)
     }
-    insights = [
-        f"Higher growth rate improves profits.",
-        f"Standard deviation = Rs. {metrics['std']:,.2f}",
-        f"Simulation runs = {runs}"
-    ]
+    insights = [t.format(std=metrics['std'], runs=runs) for t in INSIGHT_TMPL]
+    os.makedirs(save_folder, exist_ok=True)
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     excel_path = os.path.join(save_folder, f"financial_results_{ts}.xlsx")
     pdf_path = os.path.join(save_folder, f"financial_report_{ts}.pdf")
-    save_excel_with_chart(df_sim, excel_path)
     baseimg = os.path.join(save_folder, f"sim_{ts}")
-    img_hist, img_sens = save_chart_images(df_sim, baseimg)
+    # The workbook does not depend on the chart images, so write it on a worker
+    # thread while the chart images are saved here; only the PDF needs the images
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        fut_xlsx = ex.submit(save_excel_with_chart, df_sim, excel_path)
+        img_hist, img_sens = save_chart_images(fig_hist, fig_sens, baseimg)
+        fut_xlsx.result()
     create_pdf_2page(student_name,
                     {"Sales":sales, "GrowthRate":growth_rate, "Cost%":cost_pct, "Tax%":tax_pct, "Runs":runs},
                     metrics, insights, img_hist, img_sens, pdf_path)
-    return df_sim, metrics, insights, excel_path, pdf_path, img_hist, img_sens
+    return excel_path, pdf_path
 
 # ---------------------------
 # Main UI Controls
 # ---------------------------
 if "stop_flag" not in st.session_state:
     st.session_state.stop_flag = False
+if "run_count" not in st.session_state:
+    st.session_state.run_count = 0
 
 if st.button("🚀 Start Simulation"):
     st.session_state.stop_flag = False
@@ -255,20 +351,20 @@ if st.button("🛑 Stop Simulation"):
 placeholder = st.empty()
 
 if auto_refresh and not st.session_state.stop_flag:
-    while not st.session_state.stop_flag:
-        with placeholder.container():
-            st.markdown(f"**Live Update:** {datetime.now().strftime('%H:%M:%S')} | Student: {student_name}")
-            df_sim, metrics, insights, excel_path, pdf_path, img1, img2 = run_and_save_once()
-            st.image(img1, caption="Profit Distribution")
-            st.image(img2, caption="Sensitivity Chart")
-            st.success(f"Saved Excel → {excel_path} | PDF → {pdf_path}")
-        time.sleep(refresh_seconds)
+    # Non-blocking: the browser triggers a rerun every interval, returning the tick count
+    tick = st_autorefresh(interval=int(refresh_seconds * 1000), key="auto_refresh_tick")
+    with placeholder.container():
+        st.markdown(f"**Live Update:** {datetime.now().strftime('%H:%M:%S')} | Student: {student_name}")
+        df_sim, fig_hist, fig_sens = simulate_and_render(tick)
+    if st.button("💾 Save current snapshot"):
+        excel_path, pdf_path = export_artifacts(df_sim, fig_hist, fig_sens)
+        st.success(f"Saved Excel → {excel_path} | PDF → {pdf_path}")
 else:
     if st.button("Run Once (Save Outputs)"):
+        st.session_state.run_count += 1
         with placeholder.container():
-            df_sim, metrics, insights, excel_path, pdf_path, img1, img2 = run_and_save_once()
-            st.image(img1, caption="Profit Distribution")
-            st.image(img2, caption="Sensitivity Chart")
+            df_sim, fig_hist, fig_sens = simulate_and_render()
+            excel_path, pdf_path = export_artifacts(df_sim, fig_hist, fig_sens)
             st.download_button("⬇️ Download CSV", data=df_sim.to_csv(index=False).encode('utf-8'),
                                file_name="simulation_data.csv", mime="text/csv")
             with open(pdf_path, "rb") as f: